@@ -1,22 +1,82 @@
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, Response, render_template, request, jsonify, session
+from flask.json.provider import JSONProvider
 import os
+import re
 from datetime import timedelta
+
+try:
+    import orjson
+except ImportError:  # Flask's stdlib-json provider is used instead
+    orjson = None
+
 from utils import (
     SYMPTOMS,
-    vectorize_symptoms,
-    load_model,
+    SYMPTOM_SET,
+    ACTION_FEVER,
+    symptom_mask,
+    rule_action,
+    load_predictor,
+    encode_conditions,
+    decode_conditions,
     emergency_check,
     get_emergency_advice,
     get_recommendations,
 )
 
+
+class OrJSONProvider(JSONProvider):
+    """Serialize responses (and the session cookie) with orjson"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrJSONProvider(app)
 app.secret_key = "smart_healthcare_chatbot_edge"
 app.permanent_session_lifetime = timedelta(minutes=5)
 
-MODEL_PATH = os.path.join(os.path.dirname(__file__), "model.pkl")
-LE_PATH = os.path.join(os.path.dirname(__file__), "label_encoder.pkl")
-model, le = load_model(MODEL_PATH, LE_PATH)
+predict = load_predictor(os.path.dirname(__file__))
+
+# Keyword tables, built once; single words are matched against the message's
+# word set, multi-word phrases by substring
+GRATITUDE = frozenset({"thank", "thanks", "thankyou", "bye", "goodbye"})
+GRATITUDE_PHRASES = ("see you", "take care")
+GREETINGS = frozenset({"hi", "hello", "hey", "start", "good morning", "good evening"})
+EXIT_WORDS = frozenset({"exit", "quit"})
+NO_SYMPTOM = frozenset({
+    "no", "none", "nothing", "not really", "i’m fine", "i am fine", "feeling good", "nothing serious"
+})
+YES_WORDS = frozenset({"yes", "y", "yeah", "sure", "ok", "okay", "please"})
+YES_PHRASES = ("of course", "yes please")
+NO_WORDS = frozenset({"no", "n", "nope"})
+NO_PHRASES = ("not now",)
+MORE_YES_WORDS = frozenset({"yes", "y", "sure", "ok", "okay"})
+TOKEN_RE = re.compile(r"[a-z][a-z_]*")
+_NORMALIZE = str.maketrans({",": " ", ";": " ", ".": "", "!": "", "?": ""})
+
+
+def _static_reply(text):
+    """Serialize and UTF-8 encode a reply that never changes once, at import"""
+    return (app.json.dumps({"reply": text}) + "\n").encode()
+
+
+# Fixed replies, serialized once instead of per request
+_GRATITUDE_REPLY = _static_reply(
+    "You're most welcome! 🌿 Take care of your health and have a wonderful day!"
+)
+_GREETING_REPLY = _static_reply("""
+🤖 Hello again! I’m your AI-based Smart Healthcare Assistant.<br>
+I can help you understand possible conditions based on your symptoms.<br>
+Type 'list' to view all symptoms or 'exit' to quit anytime.<br><br>
+Please tell me what symptoms you're experiencing:
+""")
+_EXIT_REPLY = _static_reply("Take care of your health. Goodbye! 🩺")
+_LIST_REPLY = _static_reply("🩺 Here are the symptoms I recognize:<br>" + ", ".join(SYMPTOMS))
 
 
 @app.route("/")
@@ -30,43 +90,33 @@ def chat():
     user_input = request.json.get("message", "").strip().lower()
     if not user_input:
         return jsonify({"reply": "Please describe your symptoms."})
+    words = set(user_input.translate(_NORMALIZE).split())
 
     # 🩷 Friendly exit or gratitude handling
-    if any(word in user_input for word in [
-        "thank", "thanks", "thankyou", "bye", "goodbye", "see you", "take care"
-    ]):
+    if words & GRATITUDE or any(p in user_input for p in GRATITUDE_PHRASES):
         session.clear()
-        return jsonify({
-            "reply": "You're most welcome! 🌿 Take care of your health and have a wonderful day!"
-        })
+        return Response(_GRATITUDE_REPLY, mimetype="application/json")
 
     # 🧠 Restart conversation on greetings
-    if user_input in ("hi", "hello", "hey", "start", "good morning", "good evening"):
+    if user_input in GREETINGS:
         session.clear()
         session["step"] = "symptom"
-        return jsonify({
-            "reply": """
-🤖 Hello again! I’m your AI-based Smart Healthcare Assistant.<br>
-I can help you understand possible conditions based on your symptoms.<br>
-Type 'list' to view all symptoms or 'exit' to quit anytime.<br><br>
-Please tell me what symptoms you're experiencing:
-"""
-        })
+        return Response(_GREETING_REPLY, mimetype="application/json")
 
     # Exit command
-    if user_input in ("exit", "quit"):
+    if user_input in EXIT_WORDS:
         session.clear()
-        return jsonify({"reply": "Take care of your health. Goodbye! 🩺"})
+        return Response(_EXIT_REPLY, mimetype="application/json")
 
     # List all symptoms
     if user_input == "list":
-        return jsonify({"reply": "🩺 Here are the symptoms I recognize:<br>" + ", ".join(SYMPTOMS)})
+        return Response(_LIST_REPLY, mimetype="application/json")
 
     step = session.get("step", "symptom")
 
     # Step 1 — Symptom input
     if step == "symptom":
-        if user_input in ("no", "none", "nothing", "not really", "i’m fine", "i am fine", "feeling good", "nothing serious"):
+        if user_input in NO_SYMPTOM:
             session.clear()
             return jsonify({
                 "reply": "You mentioned no symptoms — that's great! 😊 Stay healthy and hydrated.<br>"
@@ -74,9 +124,7 @@ Please tell me what symptoms you're experiencing:
             })
 
         # 🧠 Extract symptoms from full sentence
-        words = user_input.replace(",", " ").replace(".", "").split()
-        tokens = [w.strip().replace(" ", "_") for w in words if w.strip()]
-        matched = [t for t in tokens if t in SYMPTOMS]
+        matched = [t for t in TOKEN_RE.findall(user_input) if t in SYMPTOM_SET]
 
         if not matched:
             return jsonify({
@@ -92,31 +140,31 @@ Please tell me what symptoms you're experiencing:
                 "reply": f"🚨 That sounds serious — detected '{matched_term}'.<br>{advice}<br>⚕️ Please contact emergency services immediately."
             })
 
-        session["tokens"] = matched
+        mask = symptom_mask(matched)
+        session["mask"] = mask
         session["step"] = "duration"
         return jsonify({"reply": "How long have you had these symptoms? (e.g., 2 days, 1 week)"})
 
     # Step 2 — Duration
     elif step == "duration":
-        session["duration"] = user_input
         session["step"] = "severity"
         return jsonify({"reply": "On a scale of 1 to 10, how severe would you say they are?"})
 
     # Step 3 — Severity + Fever Rule
     elif step == "severity":
-        session["severity"] = user_input
-        tokens = session["tokens"]
+        mask = session.get("mask")
+        if mask is None:  # cookie from an older version without the mask
+            session.clear()
+            session["step"] = "symptom"
+            return jsonify({"reply": "Please tell me what symptoms you're experiencing:"})
 
         # 🧠 FEVER RULE — apply BEFORE prediction
-        if "fever" in tokens and "leg_swelling" not in tokens:
+        if rule_action(mask) == ACTION_FEVER:
             preds = [("Common Cold", 0.6), ("Influenza", 0.3), ("COVID-19", 0.1)]
         else:
-            vec = vectorize_symptoms(tokens)
-            proba = model.predict_proba([vec])[0]
-            topk = sorted(list(enumerate(proba)), key=lambda x: x[1], reverse=True)[:3]
-            preds = [(le.inverse_transform([i])[0], p) for i, p in topk]
+            preds = list(predict(mask, 3))
 
-        session["preds"] = preds
+        session["pred_idx"] = encode_conditions(cond for cond, _ in preds)
         session["step"] = "ask_recommendations"
 
         reply = "Here's what I found:<br>"
@@ -127,19 +175,15 @@ Please tell me what symptoms you're experiencing:
 
     # Step 4 — Recommendations
     elif step == "ask_recommendations":
-        yes_words = {"yes", "y", "yeah", "sure", "ok", "okay", "of course", "please", "yes please"}
-        no_words = {"no", "n", "nope", "not now"}
-
-        if any(word in user_input for word in yes_words):
-            preds = session.get("preds", [])
+        if words & YES_WORDS or any(p in user_input for p in YES_PHRASES):
             reply = "💡 Recommendations:<br>"
-            for cond, _ in preds:
+            for cond in decode_conditions(session.get("pred_idx", [])):
                 reply += f"<b>{cond}</b>: {get_recommendations(cond)}<br><br>"
             session["step"] = "more_symptoms"
             reply += "Would you like to describe any other symptoms? (yes/no)"
             return jsonify({"reply": reply})
 
-        elif any(word in user_input for word in no_words):
+        elif words & NO_WORDS or any(p in user_input for p in NO_PHRASES):
             session["step"] = "more_symptoms"
             return jsonify({
                 "reply": "Alright, no worries! I hope you feel better soon 💙<br>"
@@ -151,7 +195,7 @@ Please tell me what symptoms you're experiencing:
 
     # Step 5 — Continue or End
     elif step == "more_symptoms":
-        if any(word in user_input for word in ["yes", "y", "sure", "ok", "okay"]):
+        if words & MORE_YES_WORDS:
             session["step"] = "symptom"
             return jsonify({"reply": "Please tell me what symptoms you're experiencing:"})
         else:
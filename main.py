@@ -3,27 +3,33 @@ AI-Based Smart Healthcare Chatbot (Conversational Terminal Version)
 """
 
 import os
+import sys
 import time
 from utils import (
     SYMPTOMS,
-    vectorize_symptoms,
-    load_model,
+    symptom_mask,
+    load_predictor,
     pretty_print_predictions,
     emergency_check,
     get_emergency_advice,
     get_recommendations,
 )
 
-MODEL_PATH = os.path.join(os.path.dirname(__file__), "model.pkl")
-LE_PATH = os.path.join(os.path.dirname(__file__), "label_encoder.pkl")
+# HEALTHCHAT_FAST=1 disables the typing effect (scripted runs, profiling)
+_FAST = os.environ.get("HEALTHCHAT_FAST") == "1"
 
 
 def slow_print(text, delay=0.03):
     """Simulate natural chatbot typing."""
+    if _FAST:
+        sys.stdout.write(text + "\n")
+        sys.stdout.flush()
+        return
     for ch in text:
-        print(ch, end='', flush=True)
+        sys.stdout.write(ch)
+        sys.stdout.flush()
         time.sleep(delay)
-    print()
+    sys.stdout.write("\n")
 
 
 def get_duration():
@@ -36,10 +42,12 @@ def get_severity():
     return input("You: ").strip()
 
 
-def chat_loop(model, label_encoder):
-    slow_print("🤖 Hello! I’m your AI-based Smart Healthcare Assistant.")
-    slow_print("I can help you understand possible conditions based on your symptoms.")
-    slow_print("Type 'list' to view all symptoms or 'exit' to quit anytime.\n")
+def chat_loop(predict):
+    slow_print(
+        "🤖 Hello! I’m your AI-based Smart Healthcare Assistant.\n"
+        "I can help you understand possible conditions based on your symptoms.\n"
+        "Type 'list' to view all symptoms or 'exit' to quit anytime.\n"
+    )
 
     while True:
         slow_print("Please tell me what symptoms you're experiencing:")
@@ -58,21 +66,22 @@ def chat_loop(model, label_encoder):
         # Emergency detection
         emergency, matched_term = emergency_check(tokens)
         if emergency:
-            slow_print(f"🚨 That sounds serious — detected '{matched_term}'.")
-            slow_print(get_emergency_advice(matched_term))
-            slow_print("⚕️ Please contact emergency services immediately.")
+            slow_print(
+                f"🚨 That sounds serious — detected '{matched_term}'.\n"
+                f"{get_emergency_advice(matched_term)}\n"
+                "⚕️ Please contact emergency services immediately."
+            )
             continue
 
         duration = get_duration()
         severity = get_severity()
         slow_print("\nAnalyzing your symptoms...")
-        time.sleep(1.5)
+        if not _FAST:
+            time.sleep(1.5)
 
         # Prediction
-        vec = vectorize_symptoms(tokens)
-        proba = model.predict_proba([vec])[0]
-        topk = sorted(list(enumerate(proba)), key=lambda x: x[1], reverse=True)[:3]
-        preds = [(label_encoder.inverse_transform([i])[0], p) for i, p in topk]
+        mask = symptom_mask(tokens)
+        preds = list(predict(mask, 3))
 
         slow_print("\nHere's what I found:")
         for cond, p in preds:
@@ -95,5 +104,4 @@ def chat_loop(model, label_encoder):
 
 
 if __name__ == "__main__":
-    model, le = load_model(MODEL_PATH, LE_PATH)
-    chat_loop(model, le)
+    chat_loop(load_predictor(os.path.dirname(__file__)))
@@ -7,8 +7,10 @@ Run this file once to (re)generate your edge inference model:
 import pandas as pd
 import numpy as np
 import pickle
+import joblib
 from pathlib import Path
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
 from sklearn.preprocessing import LabelEncoder
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, accuracy_score
@@ -34,54 +36,93 @@ DISEASES = [
 ]
 
 
+# Active symptoms and the probability each one is present, per disease
+SPEC = {
+    "Common Cold": (["fever", "cough", "runny_nose", "sore_throat", "fatigue"], 0.8),
+    "Influenza": (["fever", "fatigue", "headache", "sore_throat", "cough"], 0.7),
+    "Gastroenteritis": (["nausea", "vomiting", "diarrhea", "abdominal_pain"], 0.7),
+    "Migraine": (["headache", "nausea", "dizziness"], 0.6),
+    "Deep Vein Thrombosis": (["leg_swelling", "chest_pain", "shortness_of_breath"], 0.7),
+    "Allergic Reaction": (["rash", "shortness_of_breath", "sore_eyes"], 0.6),
+    "Conjunctivitis": (["sore_eyes", "headache", "fever"], 0.7),
+    "Hypertension Emergency": (["headache", "dizziness", "chest_pain"], 0.7),
+    "Myocardial Infarction": (["chest_pain", "shortness_of_breath", "fatigue"], 0.7),
+    "COVID-19": (["fever", "cough", "fatigue", "loss_of_smell", "loss_of_taste"], 0.7),
+}
+SYMPTOM_INDEX = {s: i for i, s in enumerate(SYMPTOMS)}
+
+
 def generate_synthetic_data(n_samples=500):
     """Generate a synthetic but realistic dataset for edge training."""
-    np.random.seed(42)
-    rows = []
-    for _ in range(n_samples):
-        condition = np.random.choice(DISEASES)
-        symptoms = dict.fromkeys(SYMPTOMS, 0)
-
-        # Assign realistic symptom patterns per disease
-        if condition == "Common Cold":
-            for s in ["fever", "cough", "runny_nose", "sore_throat", "fatigue"]:
-                symptoms[s] = np.random.choice([0, 1], p=[0.2, 0.8])
-        elif condition == "Influenza":
-            for s in ["fever", "fatigue", "headache", "sore_throat", "cough"]:
-                symptoms[s] = np.random.choice([0, 1], p=[0.3, 0.7])
-        elif condition == "Gastroenteritis":
-            for s in ["nausea", "vomiting", "diarrhea", "abdominal_pain"]:
-                symptoms[s] = np.random.choice([0, 1], p=[0.3, 0.7])
-        elif condition == "Migraine":
-            for s in ["headache", "nausea", "dizziness"]:
-                symptoms[s] = np.random.choice([0, 1], p=[0.4, 0.6])
-        elif condition == "Deep Vein Thrombosis":
-            for s in ["leg_swelling", "chest_pain", "shortness_of_breath"]:
-                symptoms[s] = np.random.choice([0, 1], p=[0.3, 0.7])
-        elif condition == "Allergic Reaction":
-            for s in ["rash", "shortness_of_breath", "sore_eyes"]:
-                symptoms[s] = np.random.choice([0, 1], p=[0.4, 0.6])
-        elif condition == "Conjunctivitis":
-            for s in ["sore_eyes", "headache", "fever"]:
-                symptoms[s] = np.random.choice([0, 1], p=[0.3, 0.7])
-        elif condition == "Hypertension Emergency":
-            for s in ["headache", "dizziness", "chest_pain"]:
-                symptoms[s] = np.random.choice([0, 1], p=[0.3, 0.7])
-        elif condition == "Myocardial Infarction":
-            for s in ["chest_pain", "shortness_of_breath", "fatigue"]:
-                symptoms[s] = np.random.choice([0, 1], p=[0.3, 0.7])
-        elif condition == "COVID-19":
-            for s in ["fever", "cough", "fatigue", "loss_of_smell", "loss_of_taste"]:
-                symptoms[s] = np.random.choice([0, 1], p=[0.3, 0.7])
-
-        row = {"condition": condition}
-        row.update(symptoms)
-        rows.append(row)
-
-    df = pd.DataFrame(rows)
+    rng = np.random.default_rng(42)
+    condition_ids = rng.choice(len(DISEASES), size=n_samples)
+    X = np.zeros((n_samples, len(SYMPTOMS)), dtype=np.uint8)
+
+    # Draw every disease's symptom block in one call
+    for d_idx, disease in enumerate(DISEASES):
+        active_sym, p = SPEC[disease]
+        rows = np.flatnonzero(condition_ids == d_idx)
+        cols = [SYMPTOM_INDEX[s] for s in active_sym]
+        X[np.ix_(rows, cols)] = rng.random((len(rows), len(cols))) < p
+
+    df = pd.DataFrame(X, columns=SYMPTOMS)
+    df.insert(0, "condition", np.asarray(DISEASES)[condition_ids])
     return df
 
 
+def _pad(arrays, fill):
+    """Stack per-tree arrays of different node counts into one table"""
+    width = max(len(a) for a in arrays)
+    out = np.full((len(arrays), width) + arrays[0].shape[1:], fill, dtype=arrays[0].dtype)
+    for t, a in enumerate(arrays):
+        out[t, :len(a)] = a
+    return out
+
+
+def export_forest(model, le, out_dir):
+    """Save the forest as flat tree tables (one uncompressed .npy each) so the
+    server can skip sklearn and memory-map them."""
+    trees = [est.tree_ for est in model.estimators_]
+    # Leaf class distributions, normalized the same way predict_proba does
+    values = []
+    for t in trees:
+        v = t.value[:, 0, :]
+        total = v.sum(axis=1, keepdims=True)
+        values.append(np.divide(v, total, out=np.zeros_like(v), where=total > 0))
+    tables = dict(
+        feature=_pad([t.feature for t in trees], 0).astype(np.int32),
+        threshold=_pad([t.threshold for t in trees], 0.0),
+        left=_pad([t.children_left for t in trees], -1).astype(np.int32),
+        right=_pad([t.children_right for t in trees], -1).astype(np.int32),
+        # float32 is plenty for displayed percentages and halves the leaf table
+        value=_pad(values, 0.0).astype(np.float32),
+        classes=le.classes_.astype(str),
+    )
+    out_dir.mkdir(exist_ok=True)
+    for name, arr in tables.items():
+        np.save(out_dir / f"{name}.npy", arr)
+
+
+def train_logistic(X_train, y_train, X_test, y_test, le, rf_acc, path):
+    """Fit a linear alternative; save it only if it is within 2% of the forest."""
+    lr = LogisticRegression(max_iter=1000, C=1.0).fit(X_train, y_train)
+    lr_acc = accuracy_score(y_test, lr.predict(X_test))
+    print(f"📈 Logistic regression accuracy: {lr_acc*100:.2f}%")
+    if lr_acc < rf_acc - 0.02:
+        print("ℹ️ Logistic regression trails the forest by more than 2% — not exported.")
+        # Don't let HEALTHCHAT_MODEL=lr serve a model from an earlier run
+        path.unlink(missing_ok=True)
+        return False
+    np.savez(
+        path,
+        W=lr.coef_.astype(np.float32),
+        b=lr.intercept_.astype(np.float32),
+        classes=le.classes_.astype(str),
+    )
+    print(f"⚡ Linear model saved at {path}")
+    return True
+
+
 def main():
     print("🔄 Training new healthcare model...")
 
@@ -115,10 +156,41 @@ def main():
     print("\n📊 Classification Report:\n", classification_report(y_test, preds, target_names=le.classes_))
 
     # Save model and label encoder
-    with open(BASE / "model.pkl", "wb") as f:
-        pickle.dump(model, f)
+    joblib.dump(model, BASE / "model.pkl", compress=0)
     with open(BASE / "label_encoder.pkl", "wb") as f:
         pickle.dump(le, f)
+    export_forest(model, le, BASE / "forest")
+
+    # Check the exported tables reproduce the model on the test split. This is
+    # the batch kernel's only caller, so it is JIT-compiled here, not on the server.
+    from utils import load_forest, predict_proba_batch
+    f = load_forest(BASE / "forest")
+    proba = predict_proba_batch(
+        X_test.astype(np.uint8), f["feature"], f["threshold"], f["left"], f["right"], f["value"]
+    )
+    print(f"✅ Exported forest accuracy: {accuracy_score(y_test, proba.argmax(axis=1))*100:.2f}%")
+
+    # Single-matmul alternative for edge deployments (HEALTHCHAT_MODEL=lr)
+    train_logistic(X_train, y_train, X_test, y_test, le, acc, BASE / "lr.npz")
+
+    # Compile the forest to a native library for faster edge inference (optional).
+    # A model.so left over from an earlier run would shadow the new model, so drop it first.
+    lib_path = BASE / "model.so"
+    lib_path.unlink(missing_ok=True)
+    try:
+        import treelite
+        tl_model = treelite.sklearn.import_model(model)
+        tl_model.export_lib(
+            toolchain="gcc", libpath=str(lib_path),
+            params={"parallel_comp": 4}, verbose=False
+        )
+    except ImportError:
+        print("ℹ️ treelite not installed — skipping native model export.")
+    except Exception as e:  # e.g. treelite>=4 (no export_lib) or no C toolchain
+        lib_path.unlink(missing_ok=True)
+        print(f"ℹ️ Native model export failed ({e}) — skipping.")
+    else:
+        print(f"⚙️ Compiled native model saved at {lib_path}")
 
     print("\n💾 Model and label encoder saved successfully!")
     print("🚀 You can now run: python main.py or python app.py")
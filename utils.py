@@ -4,169 +4,398 @@ Contains unique recommendations for each disease and smart emergency detection.
 """
 
 import pickle, os
+from functools import lru_cache
+from types import MappingProxyType
+import numpy as np
 
-SYMPTOMS = [
+try:
+    from numba import njit, prange
+except ImportError:  # plain Python traversal when numba is unavailable
+    def njit(*args, **kwargs):
+        return lambda fn: fn
+    prange = range
+
+try:
+    import treelite_runtime
+except ImportError:  # compiled forest is optional; sklearn is the fallback
+    treelite_runtime = None
+
+# Ordered for indexing/vectorization; use SYMPTOM_SET for membership tests
+SYMPTOMS = (
     "fever", "cough", "sore_throat", "runny_nose", "headache", "fatigue",
     "nausea", "vomiting", "diarrhea", "abdominal_pain", "chest_pain",
     "shortness_of_breath", "dizziness", "leg_swelling", "bleeding", "rash",
     "joint_pain", "loss_of_smell", "loss_of_taste", "sore_eyes"
-]
+)
+
+
+SYMPTOM_SET = frozenset(SYMPTOMS)
+_N = len(SYMPTOMS)
+_SHIFTS = np.arange(_N)
+
+# Bit i of a symptom mask is set when SYMPTOMS[i] is present
+BITS = {s: 1 << i for i, s in enumerate(SYMPTOMS)}
+FEVER = BITS["fever"]
+LEG_SWELL = BITS["leg_swelling"]
+CHEST = BITS["chest_pain"]
+SOB = BITS["shortness_of_breath"]
+DIZZY = BITS["dizziness"]
+
+# Deterministic pre-model rules, evaluated once for every possible mask
+ACTION_MODEL, ACTION_FEVER, ACTION_EMERG_CHEST = 0, 1, 2
+
+
+def _build_rule_table():
+    masks = np.arange(1 << len(SYMPTOMS))
+    table = np.zeros(masks.shape, dtype=np.uint8)
+    table[((masks & FEVER) != 0) & ((masks & LEG_SWELL) == 0)] = ACTION_FEVER
+    # Emergency combo overrides the fever rule
+    table[((masks & CHEST) != 0) & ((masks & (SOB | DIZZY)) != 0)] = ACTION_EMERG_CHEST
+    return table
+
+
+_RULE_TABLE = _build_rule_table()
+
+
+def rule_action(mask):
+    """ACTION_* constant for a symptom bitmask (single table lookup)"""
+    return _RULE_TABLE[mask]
+
+
+def symptom_mask(tokens):
+    """Int bitmask of the recognized symptoms in tokens"""
+    mask = 0
+    for t in tokens:
+        mask |= BITS.get(t, 0)
+    return mask
+
+
+def _topk_indices(proba, k):
+    """Indices of the k largest probabilities, highest first; ties keep the lower class index"""
+    return np.argsort(-proba, kind="stable")[:k]
+
 
+@njit(cache=True)
+def _forest_proba(vec, feature, threshold, left, right, value):
+    """Average leaf distribution over all trees for one binary symptom vector"""
+    n_trees = feature.shape[0]
+    out = np.zeros(value.shape[2], dtype=value.dtype)
+    for t in range(n_trees):
+        node = 0
+        while left[t, node] != -1:
+            if vec[feature[t, node]] <= threshold[t, node]:
+                node = left[t, node]
+            else:
+                node = right[t, node]
+        out += value[t, node]
+    return out / n_trees
 
-def vectorize_symptoms(tokens):
-    tokset = set(tokens)
-    return [1 if s in tokset else 0 for s in SYMPTOMS]
+
+@njit(cache=True, parallel=True, fastmath=True)
+def predict_proba_batch(X, feature, threshold, left, right, value):
+    """Forest probabilities for every row of X, rows scored in parallel"""
+    n_samples, n_trees = X.shape[0], feature.shape[0]
+    out = np.zeros((n_samples, value.shape[2]), dtype=value.dtype)
+    for s in prange(n_samples):
+        for t in range(n_trees):
+            node = 0
+            while left[t, node] != -1:
+                if X[s, feature[t, node]] <= threshold[t, node]:
+                    node = left[t, node]
+                else:
+                    node = right[t, node]
+            out[s] += value[t, node]
+        out[s] /= n_trees
+    return out
+
+
+def predict_proba_lr(vec, W, b):
+    """Softmax over the linear model's class scores for one binary symptom vector"""
+    z = W @ vec.astype(np.float32) + b
+    e = np.exp(z - z.max())
+    return e / e.sum()
+
+
+_MODEL = _CLASSES = _CLASS_INDEX = _PREDICTOR = _FOREST = _LR = None
+
+
+def _set_model(model, le, predictor=None, forest=None, lr=None):
+    global _MODEL, _CLASSES, _CLASS_INDEX, _PREDICTOR, _FOREST, _LR
+    _MODEL, _PREDICTOR, _FOREST, _LR = model, predictor, forest, lr
+    if lr is not None:
+        _CLASSES = lr["classes"]
+    elif forest is not None:
+        _CLASSES = forest["classes"]
+    else:
+        _CLASSES = le.classes_
+    _CLASS_INDEX = {c: i for i, c in enumerate(_CLASSES.tolist())}
+    predict_topk.cache_clear()
+
+
+def encode_conditions(labels):
+    """Condition names -> class indices (compact form kept in the session)"""
+    return [_CLASS_INDEX[c] for c in labels]
+
+
+def decode_conditions(idx):
+    """Class indices -> condition names"""
+    return _CLASSES[list(idx)].tolist()
+
+
+def _predict_proba(vec):
+    """Class probabilities for one (1, n_features) row"""
+    if _LR is not None:
+        return predict_proba_lr(vec[0], _LR["W"], _LR["b"])
+    if _PREDICTOR is not None:
+        dmat = treelite_runtime.DMatrix(vec.astype(np.float32))
+        return np.asarray(_PREDICTOR.predict(dmat)).reshape(-1)
+    if _FOREST is not None:
+        f = _FOREST
+        return _forest_proba(vec[0], f["feature"], f["threshold"], f["left"], f["right"], f["value"])
+    return _MODEL.predict_proba(vec)[0]
+
+
+@lru_cache(maxsize=4096)
+def predict_topk(mask, k=3):
+    """Top-k (condition, probability) pairs for a symptom bitmask, memoized"""
+    vec = ((mask >> _SHIFTS) & 1).astype(np.uint8).reshape(1, -1)
+    proba = _predict_proba(vec)
+    idx = _topk_indices(proba, k)
+    labels = _CLASSES[idx].tolist()
+    return tuple(zip(labels, proba[idx].tolist()))
 
 
 def load_model(model_path, le_path):
     if not os.path.exists(model_path) or not os.path.exists(le_path):
         raise FileNotFoundError("Model or label encoder not found. Run train_model.py first.")
-    with open(model_path, "rb") as f:
-        model = pickle.load(f)
+    import joblib  # only needed on the sklearn fallback path
+
+    model = joblib.load(model_path)
     with open(le_path, "rb") as f:
         le = pickle.load(f)
     return model, le
 
 
+FOREST_TABLES = ("feature", "threshold", "left", "right", "value", "classes")
+
+
+def load_forest(forest_dir):
+    """Tree tables exported by train_model.py, or None if absent.
+
+    The .npy files are memory-mapped read-only, so worker processes share one
+    copy through the OS page cache.
+    """
+    if not os.path.isdir(forest_dir):
+        return None
+    forest = {
+        name: np.load(os.path.join(forest_dir, f"{name}.npy"), mmap_mode="r")
+        for name in FOREST_TABLES
+    }
+    # Warm up so the first request doesn't pay the JIT compile. The parallel
+    # batch kernel is left alone: the server never calls it.
+    _forest_proba(
+        np.zeros(_N, dtype=np.uint8),
+        forest["feature"], forest["threshold"], forest["left"], forest["right"], forest["value"],
+    )
+    return forest
+
+
+def load_lr(npz_path):
+    """Linear model exported by train_model.py, or None if absent"""
+    if not os.path.exists(npz_path):
+        return None
+    with np.load(npz_path) as f:
+        return {k: f[k] for k in f.files}
+
+
+def load_compiled_model(lib_path):
+    """Native forest exported by train_model.py, or None if unavailable"""
+    if treelite_runtime is None or not os.path.exists(lib_path):
+        return None
+    return treelite_runtime.Predictor(lib_path)
+
+
+def load_predictor(base_dir):
+    """Load the best available model from base_dir and return the top-k predictor.
+
+    Priority: lr.npz (only with HEALTHCHAT_MODEL=lr), model.so, forest/, then
+    the pickled sklearn model and label encoder.
+    """
+    if os.environ.get("HEALTHCHAT_MODEL") == "lr":
+        lr = load_lr(os.path.join(base_dir, "lr.npz"))
+        if lr is not None:  # skip loading/compiling the forest entirely
+            _set_model(None, None, lr=lr)
+            return predict_topk
+    forest = load_forest(os.path.join(base_dir, "forest"))
+    if forest is None:
+        model, le = load_model(
+            os.path.join(base_dir, "model.pkl"), os.path.join(base_dir, "label_encoder.pkl")
+        )
+    else:
+        model = le = None  # exported tree tables; no sklearn needed
+    _set_model(model, le, load_compiled_model(os.path.join(base_dir, "model.so")), forest)
+    return predict_topk
+
+
 def pretty_print_predictions(preds):
     print("\n🧩 Predicted Conditions (Top 3):")
     for cond, p in preds:
         print(f" - {cond:<25} {p*100:.1f}% confidence")
 
 
+EMERGENCY_SET = frozenset({
+    "cardiac_arrest", "heart_attack", "stroke", "severe_bleeding",
+    "unconscious", "loss_of_consciousness", "difficulty_breathing",
+    "severe_chest_pain"
+})
+
+
 def emergency_check(tokens):
     """Detect high-risk symptoms not covered by model"""
-    emergency_terms = {
-        "cardiac_arrest", "heart_attack", "stroke", "severe_bleeding",
-        "unconscious", "loss_of_consciousness", "difficulty_breathing",
-        "severe_chest_pain"
-    }
+    mask = 0
     for t in tokens:
-        if t in emergency_terms:
+        if t in EMERGENCY_SET:
             return True, t
-    if "chest_pain" in tokens and ("shortness_of_breath" in tokens or "dizziness" in tokens):
+        mask |= BITS.get(t, 0)
+    if _RULE_TABLE[mask] == ACTION_EMERG_CHEST:
         return True, "chest_pain + shortness_of_breath"
     return False, None
 
 
+_CARDIAC_MSG = (
+    "🚑 Possible cardiac arrest or heart attack.\n"
+    "• Call emergency services (108 / 112) immediately.\n"
+    "• Begin CPR if the person is unresponsive and not breathing.\n"
+    "• Use an AED if available.\n"
+    "• Do NOT give food or medication unless advised by a doctor."
+)
+
+_STROKE_MSG = (
+    "🚑 Possible stroke detected.\n"
+    "• Call emergency services immediately.\n"
+    "• Note the time symptoms began.\n"
+    "• Do NOT give food or water; keep patient calm and upright."
+)
+
+_BLEEDING_MSG = (
+    "🚑 Severe bleeding detected.\n"
+    "• Apply firm pressure with a clean cloth.\n"
+    "• Do not remove soaked cloth—add another on top.\n"
+    "• Seek emergency medical attention immediately."
+)
+
+_UNCONSCIOUS_MSG = (
+    "🚨 Unconscious person detected.\n"
+    "• Check breathing and pulse.\n"
+    "• If absent, begin CPR and call emergency services.\n"
+    "• Keep airway open and stay with the person."
+)
+
+_BREATHING_MSG = (
+    "🚨 Severe breathing difficulty detected.\n"
+    "• Sit upright and loosen tight clothing.\n"
+    "• Use inhaler if prescribed.\n"
+    "• Call emergency services right away."
+)
+
+_DEFAULT_EMERG = "🚨 Critical condition detected. Seek emergency medical help immediately."
+# Checked in order; the first key found in the term wins
+_EMERG_KEYS = (
+    ("cardiac", _CARDIAC_MSG),
+    ("heart", _CARDIAC_MSG),
+    ("stroke", _STROKE_MSG),
+    ("bleeding", _BLEEDING_MSG),
+    ("unconscious", _UNCONSCIOUS_MSG),
+    ("difficulty_breathing", _BREATHING_MSG),
+)
+
+
 def get_emergency_advice(term):
     """Emergency recommendations"""
     term = term.lower()
-    if "cardiac" in term or "heart" in term:
-        return (
-            "🚑 Possible cardiac arrest or heart attack.\n"
-            "• Call emergency services (108 / 112) immediately.\n"
-            "• Begin CPR if the person is unresponsive and not breathing.\n"
-            "• Use an AED if available.\n"
-            "• Do NOT give food or medication unless advised by a doctor."
-        )
-    if "stroke" in term:
-        return (
-            "🚑 Possible stroke detected.\n"
-            "• Call emergency services immediately.\n"
-            "• Note the time symptoms began.\n"
-            "• Do NOT give food or water; keep patient calm and upright."
-        )
-    if "bleeding" in term:
-        return (
-            "🚑 Severe bleeding detected.\n"
-            "• Apply firm pressure with a clean cloth.\n"
-            "• Do not remove soaked cloth—add another on top.\n"
-            "• Seek emergency medical attention immediately."
-        )
-    if "unconscious" in term:
-        return (
-            "🚨 Unconscious person detected.\n"
-            "• Check breathing and pulse.\n"
-            "• If absent, begin CPR and call emergency services.\n"
-            "• Keep airway open and stay with the person."
-        )
-    if "difficulty_breathing" in term:
-        return (
-            "🚨 Severe breathing difficulty detected.\n"
-            "• Sit upright and loosen tight clothing.\n"
-            "• Use inhaler if prescribed.\n"
-            "• Call emergency services right away."
-        )
-    return "🚨 Critical condition detected. Seek emergency medical help immediately."
+    for key, msg in _EMERG_KEYS:
+        if key in term:
+            return msg
+    return _DEFAULT_EMERG
+
+
+_RECS = MappingProxyType({
+    "common cold": (
+        "• Rest and drink plenty of warm fluids.\n"
+        "• Inhale steam to relieve nasal congestion.\n"
+        "• Use saline nasal drops if nose is blocked.\n"
+        "• Avoid cold drinks and dust exposure.\n"
+        "• Usually resolves within a week."
+    ),
+    "influenza": (
+        "• Get complete bed rest and stay warm.\n"
+        "• Drink fluids frequently to avoid dehydration.\n"
+        "• Take prescribed antiviral medication if advised.\n"
+        "• Avoid public places until fever subsides.\n"
+        "• Consult a doctor if symptoms persist beyond 5 days."
+    ),
+    "gastroenteritis": (
+        "• Drink Oral Rehydration Solution (ORS) to replace lost fluids.\n"
+        "• Avoid milk, spicy, and oily foods.\n"
+        "• Eat bland items like rice, toast, and bananas.\n"
+        "• Wash hands thoroughly to prevent reinfection.\n"
+        "• See a doctor if vomiting persists or blood appears in stool."
+    ),
+    "migraine": (
+        "• Rest in a dark and quiet room.\n"
+        "• Apply a cold compress to your forehead.\n"
+        "• Stay hydrated and maintain consistent sleep.\n"
+        "• Avoid strong smells, caffeine, and loud noise.\n"
+        "• Consult a neurologist if migraines are frequent."
+    ),
+    "hypertension emergency": (
+        "🚨 Medical emergency!\n"
+        "• Sit calmly and avoid exertion.\n"
+        "• Do not take extra doses of medication unless prescribed.\n"
+        "• Get immediate hospital evaluation.\n"
+        "• Monitor blood pressure continuously until help arrives."
+    ),
+    "myocardial infarction": (
+        "🚨 Suspected heart attack!\n"
+        "• Call emergency services immediately.\n"
+        "• Chew aspirin if prescribed by your doctor.\n"
+        "• Sit down and stay calm.\n"
+        "• Do NOT drive yourself to the hospital."
+    ),
+    "allergic reaction": (
+        "• Identify and avoid the triggering allergen.\n"
+        "• Take an antihistamine (e.g., cetirizine) if mild.\n"
+        "• If swelling or breathing issues occur, use epinephrine if prescribed.\n"
+        "• Visit an emergency room if symptoms worsen."
+    ),
+    "deep vein thrombosis": (
+        "• Avoid sitting for long periods.\n"
+        "• Keep your leg elevated when resting.\n"
+        "• Do not massage the swollen area.\n"
+        "• Consult a doctor for ultrasound and medication.\n"
+        "• Regularly move or stretch if you sit for long hours."
+    ),
+    "covid-19": (
+        "• Isolate yourself immediately to prevent transmission.\n"
+        "• Monitor oxygen saturation and temperature.\n"
+        "• Drink warm fluids and get adequate rest.\n"
+        "• Seek medical attention if SpO2 < 94%.\n"
+        "• Follow public health guidelines for quarantine."
+    ),
+    "conjunctivitis": (
+        "• Wash hands frequently and avoid touching your eyes.\n"
+        "• Use antibiotic or lubricating eye drops as prescribed.\n"
+        "• Do not share towels, makeup, or contact lenses.\n"
+        "• Avoid bright light and rest your eyes.\n"
+        "• Usually resolves within 3–5 days."
+    ),
+})
+
+_DEFAULT_REC = (
+    "• Rest, hydrate, and monitor symptoms closely.\n• Visit a healthcare professional if you feel unwell."
+)
 
 
 def get_recommendations(condition):
     """Unique condition-specific advice"""
-    condition = condition.lower()
-    recs = {
-        "common cold": (
-            "• Rest and drink plenty of warm fluids.\n"
-            "• Inhale steam to relieve nasal congestion.\n"
-            "• Use saline nasal drops if nose is blocked.\n"
-            "• Avoid cold drinks and dust exposure.\n"
-            "• Usually resolves within a week."
-        ),
-        "influenza": (
-            "• Get complete bed rest and stay warm.\n"
-            "• Drink fluids frequently to avoid dehydration.\n"
-            "• Take prescribed antiviral medication if advised.\n"
-            "• Avoid public places until fever subsides.\n"
-            "• Consult a doctor if symptoms persist beyond 5 days."
-        ),
-        "gastroenteritis": (
-            "• Drink Oral Rehydration Solution (ORS) to replace lost fluids.\n"
-            "• Avoid milk, spicy, and oily foods.\n"
-            "• Eat bland items like rice, toast, and bananas.\n"
-            "• Wash hands thoroughly to prevent reinfection.\n"
-            "• See a doctor if vomiting persists or blood appears in stool."
-        ),
-        "migraine": (
-            "• Rest in a dark and quiet room.\n"
-            "• Apply a cold compress to your forehead.\n"
-            "• Stay hydrated and maintain consistent sleep.\n"
-            "• Avoid strong smells, caffeine, and loud noise.\n"
-            "• Consult a neurologist if migraines are frequent."
-        ),
-        "hypertension emergency": (
-            "🚨 Medical emergency!\n"
-            "• Sit calmly and avoid exertion.\n"
-            "• Do not take extra doses of medication unless prescribed.\n"
-            "• Get immediate hospital evaluation.\n"
-            "• Monitor blood pressure continuously until help arrives."
-        ),
-        "myocardial infarction": (
-            "🚨 Suspected heart attack!\n"
-            "• Call emergency services immediately.\n"
-            "• Chew aspirin if prescribed by your doctor.\n"
-            "• Sit down and stay calm.\n"
-            "• Do NOT drive yourself to the hospital."
-        ),
-        "allergic reaction": (
-            "• Identify and avoid the triggering allergen.\n"
-            "• Take an antihistamine (e.g., cetirizine) if mild.\n"
-            "• If swelling or breathing issues occur, use epinephrine if prescribed.\n"
-            "• Visit an emergency room if symptoms worsen."
-        ),
-        "deep vein thrombosis": (
-            "• Avoid sitting for long periods.\n"
-            "• Keep your leg elevated when resting.\n"
-            "• Do not massage the swollen area.\n"
-            "• Consult a doctor for ultrasound and medication.\n"
-            "• Regularly move or stretch if you sit for long hours."
-        ),
-        "covid-19": (
-            "• Isolate yourself immediately to prevent transmission.\n"
-            "• Monitor oxygen saturation and temperature.\n"
-            "• Drink warm fluids and get adequate rest.\n"
-            "• Seek medical attention if SpO2 < 94%.\n"
-            "• Follow public health guidelines for quarantine."
-        ),
-        "conjunctivitis": (
-            "• Wash hands frequently and avoid touching your eyes.\n"
-            "• Use antibiotic or lubricating eye drops as prescribed.\n"
-            "• Do not share towels, makeup, or contact lenses.\n"
-            "• Avoid bright light and rest your eyes.\n"
-            "• Usually resolves within 3–5 days."
-        ),
-    }
-
-    return recs.get(
-        condition,
-        "• Rest, hydrate, and monitor symptoms closely.\n• Visit a healthcare professional if you feel unwell."
-    )
+    return _RECS.get(condition.lower(), _DEFAULT_REC)